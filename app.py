@@ -12,14 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import argparse
+import atexit
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 from os import mkdir
 from os.path import isdir
 from pathlib import Path
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
-from data_measurements import dataset_statistics, dataset_utils
+from data_measurements import dataset_utils
 from data_measurements import streamlit_utils as st_utils
 
 """
@@ -51,8 +58,13 @@ if not logs.handlers:
     stream.setLevel(logging.WARNING)
     stream.setFormatter(streamformat)
 
-    logs.addHandler(file)
-    logs.addHandler(stream)
+    # The handlers run on a listener thread, so that slow log writes
+    # don't stall the script thread.
+    log_queue = queue.Queue(-1)
+    logs.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
 
 st.set_page_config(
     page_title="Demo to showcase dataset metrics",
@@ -62,7 +74,7 @@ st.set_page_config(
 )
 
 # colorblind-friendly colors
-colors = [
+colors = (
     "#332288",
     "#117733",
     "#882255",
@@ -71,7 +83,7 @@ colors = [
     "#44AA99",
     "#DDCC77",
     "#88CCEE",
-]
+)
 
 CACHE_DIR = dataset_utils.CACHE_DIR
 # String names we are using (not coming from the stored dataset).
@@ -83,14 +95,10 @@ LENGTH_FIELD = dataset_utils.LENGTH_FIELD
 # TODO: Allow users to specify this.
 _MIN_VOCAB_COUNT = 10
 _SHOW_TOP_N_WORDS = 10
+WIDGET_LOADERS = dataset_utils.WIDGET_LOADERS
 
 
-@st.cache(
-    hash_funcs={
-        dataset_statistics.DatasetStatisticsCacheClass: lambda dstats: dstats.cache_path
-    },
-    allow_output_mutation=True,
-)
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
 def load_or_prepare(ds_args, show_embeddings, use_cache=False):
     """
     Takes the dataset arguments from the GUI and uses them to load a dataset from the Hub or, if
@@ -102,6 +110,9 @@ def load_or_prepare(ds_args, show_embeddings, use_cache=False):
     Returns:
         dstats: the computed dataset statistics (from the dataset_statistics class)
     """
+    # Imported here as it pulls in torch, transformers, sklearn, etc.
+    from data_measurements import dataset_statistics
+
     if not isdir(CACHE_DIR):
         logs.warning("Creating cache")
         # We need to preprocess everything.
@@ -136,12 +147,9 @@ def load_or_prepare(ds_args, show_embeddings, use_cache=False):
     dstats.load_or_prepare_zipf()
     return dstats
 
-@st.cache(
-    hash_funcs={
-        dataset_statistics.DatasetStatisticsCacheClass: lambda dstats: dstats.cache_path
-    },
-    allow_output_mutation=True,
-)
+# No spinner from the cache: B's load runs on a worker thread, and display
+# calls must stay on the main thread. main() shows its own spinners instead.
+@st.cache_resource(ttl=3600, max_entries=32, show_spinner=False)
 def load_or_prepare_widgets(ds_args, show_embeddings, live=True, use_cache=False):
     """
     Loader specifically for the widgets used in the app.
@@ -153,6 +161,7 @@ def load_or_prepare_widgets(ds_args, show_embeddings, live=True, use_cache=False
     Returns:
 
     """
+    from data_measurements import dataset_statistics
 
     if use_cache:
         logs.warning("Using cache")
@@ -163,55 +172,60 @@ def load_or_prepare_widgets(ds_args, show_embeddings, live=True, use_cache=False
     # creates cache_dir if not and if in development mode
     cache_dir_exists = dstats.check_cache_dir()
     if cache_dir_exists:
-        try:
-            # We need to have the text_dset loaded for further load_or_prepare
-            dstats.load_or_prepare_dataset()
-        except:
-            logs.warning("Missing a cache for load or prepare dataset")
-        try:
-            # Header widget
-            dstats.load_or_prepare_dset_peek()
-        except:
-            logs.warning("Missing a cache for dset peek")
-        try:
-            # General stats widget
-            dstats.load_or_prepare_general_stats()
-        except:
-            logs.warning("Missing a cache for general stats")
-        try:
-            # Labels widget
-            dstats.load_or_prepare_labels()
-        except:
-            logs.warning("Missing a cache for prepare labels")
-        try:
-            # Text lengths widget
-            dstats.load_or_prepare_text_lengths()
-        except:
-            logs.warning("Missing a cache for text lengths")
+        # We need to have the text_dset loaded for further load_or_prepare
+        load_or_warn(dstats.load_or_prepare_dataset, "dataset")
+        widget_loaders = [
+            (name, getattr(dstats, method)) for name, method in WIDGET_LOADERS
+        ]
         if show_embeddings:
-            try:
-                # Embeddings widget
-                dstats.load_or_prepare_embeddings()
-            except:
-                logs.warning("Missing a cache for embeddings")
-        try:
-            dstats.load_or_prepare_text_duplicates()
-        except:
-            logs.warning("Missing a cache for text duplicates")
-        try:
-            dstats.load_or_prepare_text_perplexities()
-        except:
-            logs.warning("Missing a cache for text perplexities")
-        try:
-            dstats.load_or_prepare_npmi()
-        except:
-            logs.warning("Missing a cache for npmi")
-        try:
-            dstats.load_or_prepare_zipf()
-        except:
-            logs.warning("Missing a cache for zipf")
+            widget_loaders.append(("embeddings", dstats.load_or_prepare_embeddings))
+        if dstats.live:
+            # Nothing is recomputed when live: each loader only reads its own
+            # cache files into its own attributes, so the reads can overlap.
+            with make_executor(min(len(widget_loaders), 8)) as executor:
+                for name, load_fn in widget_loaders:
+                    executor.submit(load_or_warn, load_fn, name)
+        else:
+            # In development, preparing one widget may compute shared
+            # intermediate results (e.g. the tokenized text) for the others.
+            for name, load_fn in widget_loaders:
+                load_or_warn(load_fn, name)
     return dstats, cache_dir_exists
 
+
+def load_or_warn(load_fn, name):
+    """
+    Calls a load_or_prepare function, logging instead of failing when the
+    corresponding cache is missing, and logs how long the call took.
+    Args:
+        load_fn (function): the load_or_prepare function to call
+        name (str): the name of the measurement, used for logging
+    """
+    start = time.perf_counter()
+    try:
+        load_fn()
+    except:
+        logs.warning("Missing a cache for %s", name)
+    logs.warning("Loading %s took %.3fs", name, time.perf_counter() - start)
+
+
+def make_executor(max_workers):
+    """
+    Creates a thread pool whose worker threads carry the Streamlit script run
+    context of the calling thread, so that cached loaders can run off the
+    main thread. Rendering (st.*) calls should stay on the main thread.
+    Args:
+        max_workers (int): the maximum number of worker threads
+    Returns:
+        ThreadPoolExecutor: the executor
+    """
+    ctx = get_script_run_ctx()
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx),
+    )
+
+
 def show_column(dstats, ds_name_to_dict, show_embeddings, column_id):
     """
     Function for displaying the elements in the right column of the streamlit app.
@@ -256,7 +270,7 @@ def main():
         "--live", required=False, default='True', help="Flag to specify that this is not running live.", choices=('True','False')
     )
     arguments = parser.parse_args()
-    live = arguments.live
+    live = arguments.live == "True"
     """ Sidebar description and selection """
     ds_name_to_dict = dataset_utils.get_dataset_info_dicts()
     st.title("Data Measurements Tool")
@@ -275,18 +289,30 @@ def main():
         dataset_args_left = st_utils.sidebar_selection(ds_name_to_dict, " A")
         dataset_args_right = st_utils.sidebar_selection(ds_name_to_dict, " B")
         left_col, _, right_col = st.columns([10, 1, 10])
-        dstats_left, cache_exists_left = load_or_prepare_widgets(
-            dataset_args_left, show_embeddings, use_cache=use_cache
-        )
-        with left_col:
-            if cache_exists_left:
-                show_column(dstats_left, ds_name_to_dict, show_embeddings, " A")
+        with make_executor(1) as executor:
+            # Read B's caches in the background while A loads and renders.
+            # When both columns show the same selection, B reuses A's dstats
+            # rather than loading the same caches a second time.
+            future_right = None
+            if dataset_args_right != dataset_args_left:
+                future_right = executor.submit(
+                    load_or_prepare_widgets, dataset_args_right, show_embeddings, use_cache=use_cache
+                )
+            with left_col:
+                with st.spinner("Loading dataset A..."):
+                    dstats_left, cache_exists_left = load_or_prepare_widgets(
+                        dataset_args_left, show_embeddings, use_cache=use_cache
+                    )
+                if cache_exists_left:
+                    show_column(dstats_left, ds_name_to_dict, show_embeddings, " A")
+                else:
+                    st.markdown("### Missing pre-computed data measures!")
+                    st.write(dataset_args_left)
+            if future_right is None:
+                dstats_right, cache_exists_right = dstats_left, cache_exists_left
             else:
-                st.markdown("### Missing pre-computed data measures!")
-                st.write(dataset_args_left)
-        dstats_right, cache_exists_right = load_or_prepare_widgets(
-            dataset_args_right, show_embeddings, use_cache=use_cache
-        )
+                with right_col, st.spinner("Loading dataset B..."):
+                    dstats_right, cache_exists_right = future_right.result()
         with right_col:
             if cache_exists_right:
                 show_column(dstats_right, ds_name_to_dict, show_embeddings, " B")
@@ -296,7 +322,8 @@ def main():
     else:
         logs.warning("Using Single Dataset Mode")
         dataset_args = st_utils.sidebar_selection(ds_name_to_dict, "")
-        dstats, cache_exists = load_or_prepare_widgets(dataset_args, show_embeddings, live=live, use_cache=use_cache)
+        with st.spinner("Loading dataset..."):
+            dstats, cache_exists = load_or_prepare_widgets(dataset_args, show_embeddings, live=live, use_cache=use_cache)
         if cache_exists:
             show_column(dstats, ds_name_to_dict, show_embeddings, "")
         else:
@@ -15,8 +15,10 @@
 import json
 import logging
 import statistics
-from os import mkdir, getenv
-from os.path import exists, isdir
+import tempfile
+import time
+from os import listdir, mkdir, getenv, replace
+from os.path import basename, dirname, exists, getmtime, isdir
 from os.path import join as pjoin
 from pathlib import Path
 from dotenv import load_dotenv
@@ -144,6 +146,13 @@ _TREE_MIN_NODES = 250
 _MAX_CLUSTER_EXAMPLES = 5000
 _NUM_VOCAB_BATCHES = 2000
 _TOP_N = 100
+# bumped when the cache layout changes, so older manifests are ignored
+_MANIFEST_VERSION = 1
+# how long (in seconds) the list of caches stored on the Hub is reused;
+# newly pushed caches are found in the app after at most this long
+_HUB_CACHES_TTL = 60 * 60
+# tables smaller than this are written uncompressed (see write_df)
+_MIN_COMPRESS_BYTES = 64 * 1024
 _CVEC = CountVectorizer(token_pattern="(?u)\\b\\w+\\b", lowercase=True)
 
 _PERPLEXITY = load_metric("perplexity")
@@ -261,10 +270,12 @@ class DatasetStatisticsCacheClass:
         # Things that get defined later.
         self.fig_tok_length_png = None
         self.length_stats_dict = None
+        # Names of the files in self.cache_path, scanned by check_cache_dir
+        self.cache_fnames = set()
 
         # Try to pull from the hub to see if the cache already exists.
         try:
-            if not isdir(self.cache_path) and self.dataset_cache_dir in [dataset_info.id.split("/")[-1] for dataset_info in list_datasets(author="datameasurements", use_auth_token=HF_TOKEN)]:
+            if not isdir(self.cache_path) and hub_cache_exists(self.cache_dir, self.dataset_cache_dir):
                 repo = Repository(local_dir=self.cache_path, clone_from="datameasurements/" + self.dataset_cache_dir, repo_type="dataset", use_auth_token=HF_TOKEN)
             else:
                 logs.warning("Cannot find cached repo.")
@@ -318,6 +329,9 @@ class DatasetStatisticsCacheClass:
         # Needed for UI
         self.fig_tree_json_fid = pjoin(self.cache_path, "fig_tree.json")
 
+        ## Written once every measurement has been prepared
+        self.manifest_json_fid = pjoin(self.cache_path, "manifest.json")
+
         self.live = False
 
     def set_deployment(self, live=True):
@@ -331,18 +345,58 @@ class DatasetStatisticsCacheClass:
         """
         First function to call to create the cache directory.
         If in deployment mode and cache directory does not already exist,
-        return False.
+        return False. Otherwise, records the names of the files it holds.
         """
-        if self.live:
-            return isdir(self.cache_path)
-        else:
-            if not isdir(self.cache_path):
-                logs.warning("Creating cache directory %s." % self.cache_path)
-                if not isdir(self.cache_dir):
-                    mkdir(self.cache_dir)
-                mkdir(self.cache_path)
-            return isdir(self.cache_path)
+        if not isdir(self.cache_path):
+            if self.live:
+                return False
+            logs.warning("Creating cache directory %s.", self.cache_path)
+            if not isdir(self.cache_dir):
+                mkdir(self.cache_dir)
+            mkdir(self.cache_path)
+        # One directory listing instead of a stat per cache file.
+        self.cache_fnames = set(listdir(self.cache_path))
+        return True
+
+    def cache_exists(self, fid):
+        """
+        Whether the cache file fid exists. Files found by the directory scan in
+        check_cache_dir need no further stat; anything else (not scanned, or
+        written since) is checked on disk.
+        """
+        if dirname(fid) == self.cache_path and basename(fid) in self.cache_fnames:
+            return True
+        return exists(fid)
+
+    def write_manifest(self, steps):
+        """
+        Marks the cache as complete, listing the measurements that were
+        prepared, so that later runs can skip preparing them again.
+        """
+        write_json(
+            {"complete": True, "steps": steps, "version": _MANIFEST_VERSION},
+            self.manifest_json_fid,
+        )
 
+    def cache_is_complete(self, steps):
+        """
+        Whether a manifest for the current cache layout says that all of the
+        given measurements have already been prepared.
+        A missing or unreadable manifest means the cache is not complete.
+        """
+        if not self.cache_exists(self.manifest_json_fid):
+            return False
+        try:
+            with open(self.manifest_json_fid, "r") as f:
+                manifest = json.load(f)
+            return (
+                manifest["complete"]
+                and manifest["version"] == _MANIFEST_VERSION
+                and set(steps) <= set(manifest["steps"])
+            )
+        except (ValueError, KeyError, TypeError):
+            logs.warning("Could not read %s; ignoring it.", self.manifest_json_fid)
+            return False
 
     def get_base_dataset(self):
         """Gets a pointer to the truncated base dataset object."""
@@ -369,10 +423,10 @@ class DatasetStatisticsCacheClass:
         # General statistics
         if (
             self.use_cache
-            and exists(self.general_stats_json_fid)
-            and exists(self.dup_counts_df_fid)
-            and exists(self.perplexities_df_fid)
-            and exists(self.sorted_top_vocab_df_fid)
+            and self.cache_exists(self.general_stats_json_fid)
+            and self.cache_exists(self.dup_counts_df_fid)
+            and self.cache_exists(self.perplexities_df_fid)
+            and self.cache_exists(self.sorted_top_vocab_df_fid)
         ):
             logs.info("Loading cached general stats")
             self.load_general_stats()
@@ -397,7 +451,7 @@ class DatasetStatisticsCacheClass:
 
         """
         # Text length figure
-        if self.use_cache and exists(self.fig_tok_length_fid):
+        if self.use_cache and self.cache_exists(self.fig_tok_length_fid):
             self.fig_tok_length_png = mpimg.imread(self.fig_tok_length_fid)
         else:
             if not self.live:
@@ -405,8 +459,8 @@ class DatasetStatisticsCacheClass:
                 if save:
                     self.fig_tok_length.savefig(self.fig_tok_length_fid)
         # Text length dataframe
-        if self.use_cache and exists(self.length_df_fid):
-            self.length_df = feather.read_feather(self.length_df_fid)
+        if self.use_cache and self.cache_exists(self.length_df_fid):
+            self.length_df = read_df(self.length_df_fid)
         else:
             if not self.live:
                 self.prepare_length_df()
@@ -414,7 +468,7 @@ class DatasetStatisticsCacheClass:
                     write_df(self.length_df, self.length_df_fid)
 
         # Text length stats.
-        if self.use_cache and exists(self.length_stats_json_fid):
+        if self.use_cache and self.cache_exists(self.length_stats_json_fid):
             with open(self.length_stats_json_fid, "r") as f:
                 self.length_stats_dict = json.load(f)
             self.avg_length = self.length_stats_dict["avg length"]
@@ -481,7 +535,7 @@ class DatasetStatisticsCacheClass:
         :param
         :return:
         """
-        if self.use_cache and exists(self.vocab_counts_df_fid):
+        if self.use_cache and self.cache_exists(self.vocab_counts_df_fid):
             logs.info("Reading vocab from cache")
             self.load_vocab()
             self.vocab_counts_filtered_df = filter_vocab(self.vocab_counts_df)
@@ -505,15 +559,13 @@ class DatasetStatisticsCacheClass:
         logs.info(self.vocab_counts_filtered_df)
 
     def load_vocab(self):
-        with open(self.vocab_counts_df_fid, "rb") as f:
-            self.vocab_counts_df = feather.read_feather(f)
+        self.vocab_counts_df = read_df(self.vocab_counts_df_fid)
         # Handling for changes in how the index is saved.
         self.vocab_counts_df = _set_idx_col_names(self.vocab_counts_df)
 
     def load_or_prepare_text_duplicates(self, save=True):
-        if self.use_cache and exists(self.dup_counts_df_fid):
-            with open(self.dup_counts_df_fid, "rb") as f:
-                self.dup_counts_df = feather.read_feather(f)
+        if self.use_cache and self.cache_exists(self.dup_counts_df_fid):
+            self.dup_counts_df = read_df(self.dup_counts_df_fid)
         elif self.dup_counts_df is None:
             if not self.live:
                 self.prepare_text_duplicates()
@@ -528,9 +580,8 @@ class DatasetStatisticsCacheClass:
                     write_df(self.dup_counts_df, self.dup_counts_df_fid)
 
     def load_or_prepare_text_perplexities(self, save=True):
-        if self.use_cache and exists(self.perplexities_df_fid):
-            with open(self.perplexities_df_fid, "rb") as f:
-                self.perplexities_df = feather.read_feather(f)
+        if self.use_cache and self.cache_exists(self.perplexities_df_fid):
+            self.perplexities_df = read_df(self.perplexities_df_fid)
         elif self.perplexities_df is None:
             if not self.live:
                 self.prepare_text_perplexities()
@@ -545,8 +596,7 @@ class DatasetStatisticsCacheClass:
         self.general_stats_dict = json.load(
             open(self.general_stats_json_fid, encoding="utf-8")
         )
-        with open(self.sorted_top_vocab_df_fid, "rb") as f:
-            self.sorted_top_vocab_df = feather.read_feather(f)
+        self.sorted_top_vocab_df = read_df(self.sorted_top_vocab_df_fid)
         self.text_nan_count = self.general_stats_dict[TEXT_NAN_CNT]
         self.dedup_total = self.general_stats_dict[DEDUP_TOT]
         self.total_words = self.general_stats_dict[TOT_WORDS]
@@ -617,7 +667,7 @@ class DatasetStatisticsCacheClass:
         self.load_or_prepare_dset_peek(save)
 
     def load_or_prepare_dset_peek(self, save=True):
-        if self.use_cache and exists(self.dset_peek_json_fid):
+        if self.use_cache and self.cache_exists(self.dset_peek_json_fid):
             with open(self.dset_peek_json_fid, "r") as f:
                 self.dset_peek = json.load(f)["dset peek"]
         else:
@@ -629,8 +679,8 @@ class DatasetStatisticsCacheClass:
                     write_json({"dset peek": self.dset_peek}, self.dset_peek_json_fid)
 
     def load_or_prepare_tokenized_df(self, save=True):
-        if self.use_cache and exists(self.tokenized_df_fid):
-            self.tokenized_df = feather.read_feather(self.tokenized_df_fid)
+        if self.use_cache and self.cache_exists(self.tokenized_df_fid):
+            self.tokenized_df = read_df(self.tokenized_df_fid)
         else:
             if not self.live:
                 # tokenize all text instances
@@ -641,7 +691,7 @@ class DatasetStatisticsCacheClass:
                     write_df(self.tokenized_df, self.tokenized_df_fid)
 
     def load_or_prepare_text_dset(self, save=True):
-        if self.use_cache and exists(self.text_dset_fid):
+        if self.use_cache and self.cache_exists(self.text_dset_fid):
             # load extracted text
             self.text_dset = load_from_disk(self.text_dset_fid)
             logs.warning("Loaded dataset from disk")
@@ -712,9 +762,9 @@ class DatasetStatisticsCacheClass:
         """
         # extracted labels
         if len(self.label_field) > 0:
-            if self.use_cache and exists(self.fig_labels_json_fid):
+            if self.use_cache and self.cache_exists(self.fig_labels_json_fid):
                 self.fig_labels = read_plotly(self.fig_labels_json_fid)
-            elif self.use_cache and exists(self.label_dset_fid):
+            elif self.use_cache and self.cache_exists(self.label_dset_fid):
                 # load extracted labels
                 self.label_dset = load_from_disk(self.label_dset_fid)
                 self.label_df = self.label_dset.to_pandas()
@@ -754,13 +804,13 @@ class DatasetStatisticsCacheClass:
         # TODO: Current UI only uses the fig, meaning the self.z here is irrelevant
         # when only reading from cache. Either the UI should use it, or it should
         # be removed when reading in cache
-        if self.use_cache and exists(self.zipf_fig_fid) and exists(self.zipf_fid):
+        if self.use_cache and self.cache_exists(self.zipf_fig_fid) and self.cache_exists(self.zipf_fid):
             with open(self.zipf_fid, "r") as f:
                 zipf_dict = json.load(f)
             self.z = Zipf()
             self.z.load(zipf_dict)
             self.zipf_fig = read_plotly(self.zipf_fig_fid)
-        elif self.use_cache and exists(self.zipf_fid):
+        elif self.use_cache and self.cache_exists(self.zipf_fid):
             # TODO: Read zipf data so that the vocab is there.
             with open(self.zipf_fid, "r") as f:
                 zipf_dict = json.load(f)
@@ -776,6 +826,44 @@ class DatasetStatisticsCacheClass:
                 write_zipf_data(self.z, self.zipf_fid)
                 write_plotly(self.zipf_fig, self.zipf_fig_fid)
 
+
+def hub_cache_exists(cache_dir, dataset_cache_dir):
+    """
+    Checks whether the datameasurements organization on the Hub has a cache
+    repo for dataset_cache_dir. The list of repos is stored in cache_dir and
+    reused for _HUB_CACHES_TTL seconds, so that neither restarts nor datasets
+    without a Hub cache re-fetch it.
+    :param cache_dir: local directory holding the dataset caches
+    :param dataset_cache_dir: name of the dataset cache to look for
+    :return: Whether the Hub has the cache.
+    """
+    hub_caches_fid = pjoin(cache_dir, "hub_caches.json")
+    if (
+        exists(hub_caches_fid)
+        and time.time() - getmtime(hub_caches_fid) < _HUB_CACHES_TTL
+    ):
+        try:
+            with open(hub_caches_fid, "r") as f:
+                return dataset_cache_dir in json.load(f)["hub caches"]
+        except (ValueError, KeyError):
+            logs.warning("Could not read %s; re-fetching.", hub_caches_fid)
+    hub_caches = [
+        dataset_info.id.split("/")[-1]
+        for dataset_info in list_datasets(
+            author="datameasurements", use_auth_token=HF_TOKEN
+        )
+    ]
+    if isdir(cache_dir):
+        # Written to a temporary file and then renamed, as the two datasets of
+        # comparison mode are loaded concurrently.
+        with tempfile.NamedTemporaryFile(
+            "w", dir=cache_dir, suffix=".tmp", delete=False, encoding="utf-8"
+        ) as f:
+            json.dump({"hub caches": hub_caches}, f)
+        replace(f.name, hub_caches_fid)
+    return dataset_cache_dir in hub_caches
+
+
 def _set_idx_col_names(input_vocab_df):
     if input_vocab_df.index.name != VOCAB and VOCAB in input_vocab_df.columns:
         input_vocab_df = input_vocab_df.set_index([VOCAB])
@@ -819,7 +907,7 @@ class nPMIStatisticsCacheClass:
         self.dstats = dataset_stats
         self.pmi_cache_path = pjoin(self.dstats.cache_path, "pmi_files")
         if not isdir(self.pmi_cache_path):
-            logs.warning("Creating pmi cache directory %s." % self.pmi_cache_path)
+            logs.warning("Creating pmi cache directory %s.", self.pmi_cache_path)
             # We need to preprocess everything.
             mkdir(self.pmi_cache_path)
         self.joint_npmi_df_dict = {}
@@ -845,7 +933,7 @@ class nPMIStatisticsCacheClass:
         # TODO: Make min_vocab_count here value selectable by the user.
         if (
             self.use_cache
-            and exists(self.npmi_terms_fid)
+            and self.dstats.cache_exists(self.npmi_terms_fid)
             and json.load(open(self.npmi_terms_fid))["available terms"] != []
         ):
             available_terms = json.load(open(self.npmi_terms_fid))["available terms"]
@@ -975,7 +1063,7 @@ class nPMIStatisticsCacheClass:
             # If the subgroup data is already computed, grab it.
             # TODO: Should we set idx and column names similarly to how we set them for cached files?
             if subgroup not in subgroup_dict:
-                logs.info("Calculating statistics for %s" % subgroup)
+                logs.info("Calculating statistics for %s", subgroup)
                 vocab_cooc_df, pmi_df, npmi_df = npmi_obj.calc_metrics(subgroup)
                 # Store the nPMI information for the current subgroups
                 subgroup_dict[subgroup] = (vocab_cooc_df, pmi_df, npmi_df)
@@ -1062,7 +1150,7 @@ def count_vocab_frequencies(tokenized_df):
     i = 0
     tf = []
     while i < len(batches) - 1:
-        logs.info("%s of %s vocab batches" % (str(i), str(len(batches))))
+        logs.info("%s of %s vocab batches", i, len(batches))
         batch_result = np.sum(
             document_matrix[batches[i] : batches[i + 1]].toarray(), axis=0
         )
@@ -1238,8 +1326,19 @@ def intersect_dfs(df_dict):
     return new_df.copy()
 
 
+def read_df(df_fid):
+    return feather.read_feather(df_fid)
+
+
 def write_df(df, df_fid):
-    feather.write_feather(df, df_fid)
+    # Large tables are compressed with zstd: the caches are smaller on disk
+    # and on the Hub, at the cost of decoding them into memory on read
+    # (they can't be memory-mapped). Small tables aren't worth compressing.
+    if df.memory_usage(deep=True).sum() < _MIN_COMPRESS_BYTES:
+        compression = "uncompressed"
+    else:
+        compression = "zstd"
+    feather.write_feather(df, df_fid, compression=compression)
 
 
 def write_json(json_dict, json_fid):
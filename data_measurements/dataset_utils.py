@@ -49,6 +49,19 @@ DEDUP_TOT = "dedup_total"
 TOT_WORDS = "total words"
 TOT_OPEN_WORDS = "total open words"
 
+# The cached measurement behind each widget of the app, as
+# (name for logging, DatasetStatisticsCacheClass method that loads it).
+WIDGET_LOADERS = (
+    ("dset peek", "load_or_prepare_dset_peek"),
+    ("general stats", "load_or_prepare_general_stats"),
+    ("prepare labels", "load_or_prepare_labels"),
+    ("text lengths", "load_or_prepare_text_lengths"),
+    ("text duplicates", "load_or_prepare_text_duplicates"),
+    ("text perplexities", "load_or_prepare_text_perplexities"),
+    ("npmi", "load_or_prepare_npmi"),
+    ("zipf", "load_or_prepare_zipf"),
+)
+
 _DATASET_LIST = [
     "c4",
     "squad",
@@ -249,7 +262,7 @@ def dictionarize_info(dset_info):
     return res
 
 
-@st.cache
+@st.cache_data
 def get_dataset_info_dicts(dataset_id=None):
     """
     Creates a dict from dataset configs.
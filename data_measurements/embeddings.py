@@ -13,6 +13,8 @@
 # limitations under the License.
 
 import math
+import pickle
+import threading
 from os.path import exists
 from os.path import join as pjoin
 
@@ -25,6 +27,22 @@ from tqdm import tqdm
 
 from .dataset_utils import EMBEDDING_FIELD
 
+# Tokenizers and models shared by all Embeddings objects in the process,
+# keyed by (model name, device), so that e.g. the two datasets shown in
+# comparison mode don't each hold a copy of the same weights.
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def load_model(model_name, device):
+    """Returns the shared (tokenizer, model) pair, loading it on first use."""
+    with _MODELS_LOCK:
+        if (model_name, device) not in _MODELS:
+            tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+            model = transformers.AutoModel.from_pretrained(model_name).to(device)
+            _MODELS[(model_name, device)] = (tokenizer, model)
+        return _MODELS[(model_name, device)]
+
 
 def sentence_mean_pooling(model_output, attention_mask):
     """Mean pooling of token embeddings for a sentence."""
@@ -51,10 +69,6 @@ class Embeddings:
         """Item embeddings and clustering"""
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         self.model_name = "sentence-transformers/all-mpnet-base-v2"
-        self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.model_name)
-        self.model = transformers.AutoModel.from_pretrained(self.model_name).to(
-            self.device
-        )
         self.text_dset = text_dset if dstats is None else dstats.text_dset
         self.text_field_name = (
             text_field_name if dstats is None else dstats.our_text_field
@@ -70,6 +84,15 @@ class Embeddings:
         self.cached_clusters = {}
         self.use_cache = use_cache
 
+    # Only needed to compute new embeddings, so loaded on first use.
+    @property
+    def tokenizer(self):
+        return load_model(self.model_name, self.device)[0]
+
+    @property
+    def model(self):
+        return load_model(self.model_name, self.device)[1]
+
     def compute_sentence_embeddings(self, sentences):
         """
         Takes a list of sentences and computes their embeddings
@@ -145,7 +168,14 @@ class Embeddings:
             self.nid_map = dict(
                 [(node["nid"], nid) for nid, node in enumerate(self.node_list)]
             )
-            torch.save((self.node_list, self.nid_map), self.node_list_fid)
+            # torch.save writes tensor storages as separate entries, so the
+            # pickle protocol only applies to the list and dicts around the
+            # centroids; its default there is protocol 2.
+            torch.save(
+                (self.node_list, self.nid_map),
+                self.node_list_fid,
+                pickle_protocol=pickle.HIGHEST_PROTOCOL,
+            )
         print(exists(self.fig_tree_fid), self.fig_tree_fid)
         if self.use_cache and exists(self.fig_tree_fid):
             self.fig_tree = read_json(self.fig_tree_fid)
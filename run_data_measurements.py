@@ -40,6 +40,17 @@ def load_or_prepare_widgets(ds_args, show_embeddings=False, use_cache=False):
 
     dstats = dataset_statistics.DatasetStatisticsCacheClass(**ds_args,
                                                             use_cache=use_cache)
+    steps = [name for name, _ in dataset_utils.WIDGET_LOADERS]
+    if not ds_args["label_field"]:
+        # Datasets without labels have no label distribution to prepare.
+        steps.remove("prepare labels")
+    if show_embeddings:
+        steps.append("embeddings")
+    if use_cache and dstats.cache_is_complete(steps):
+        print("All measurements are already cached at %s." % dstats.cache_path)
+        return
+    # Only marked complete if every step succeeds.
+    complete = True
     # Header widget
     dstats.load_or_prepare_dset_peek()
     # General stats widget
@@ -49,7 +60,8 @@ def load_or_prepare_widgets(ds_args, show_embeddings=False, use_cache=False):
         dstats.set_label_field("label")
         dstats.load_or_prepare_labels()
     except:
-        pass
+        if "prepare labels" in steps:
+            complete = False
     # Text lengths widget
     dstats.load_or_prepare_text_lengths()
     if show_embeddings:
@@ -57,6 +69,8 @@ def load_or_prepare_widgets(ds_args, show_embeddings=False, use_cache=False):
         dstats.load_or_prepare_embeddings()
     # Text duplicates widget
     dstats.load_or_prepare_text_duplicates()
+    # Text perplexities widget
+    dstats.load_or_prepare_text_perplexities()
     # nPMI widget
     dstats.load_or_prepare_npmi()
     npmi_stats = dstats.npmi_stats
@@ -64,6 +78,8 @@ def load_or_prepare_widgets(ds_args, show_embeddings=False, use_cache=False):
     do_npmi(npmi_stats)
     # Zipf widget
     dstats.load_or_prepare_zipf()
+    if complete:
+        dstats.write_manifest(steps)
 
 
 def load_or_prepare(dataset_args, do_html=False, use_cache=False):